@@ -5,19 +5,21 @@
 """Charmed operator for the 5G PCF service."""
 
 import logging
+from functools import cached_property
 from ipaddress import IPv4Address
+from pathlib import Path
 from subprocess import check_output
-from typing import Dict, Optional, Union
+from typing import Dict, NamedTuple, Optional, Tuple, Union
 
 from charms.data_platform_libs.v0.data_interfaces import DatabaseCreatedEvent, DatabaseRequires
 from charms.nrf_operator.v0.nrf import NRFAvailableEvent, NRFRequires
 from charms.observability_libs.v1.kubernetes_service_patch import KubernetesServicePatch
-from jinja2 import Environment, FileSystemLoader
+from jinja2 import Environment, FileSystemBytecodeCache, FileSystemLoader
 from lightkube.models.core_v1 import ServicePort
-from ops.charm import CharmBase, PebbleReadyEvent
+from ops.charm import CharmBase, PebbleReadyEvent, RelationJoinedEvent
 from ops.main import main
 from ops.model import ActiveStatus, BlockedStatus, WaitingStatus
-from ops.pebble import Layer
+from ops.pebble import Layer, PathError
 
 logger = logging.getLogger(__name__)
 
@@ -25,6 +27,31 @@ BASE_CONFIG_PATH = "/etc/pcf"
 CONFIG_FILE_NAME = "pcfcfg.conf"
 DATABASE_NAME = "free5gc"
 
+_SBI_PORTS = [ServicePort(name="sbi", port=29507)]
+
+_STATIC_ENVIRONMENT_VARIABLES = {
+    "GRPC_GO_LOG_VERBOSITY_LEVEL": "99",
+    "GRPC_GO_LOG_SEVERITY_LEVEL": "info",
+    "GRPC_TRACE": "all",
+    "GRPC_VERBOSITY": "debug",
+    "MANAGED_BY_CONFIG_POD": "true",
+}
+
+_JINJA_ENV = Environment(
+    loader=FileSystemLoader(Path(__file__).parent / "templates"),
+    auto_reload=False,
+    bytecode_cache=FileSystemBytecodeCache(),
+)
+_PCF_TEMPLATE = _JINJA_ENV.get_template(f"{CONFIG_FILE_NAME}.j2")
+
+
+class Preconditions(NamedTuple):
+    """State the charm needs before it can configure the PCF workload."""
+
+    can_connect: bool
+    database_relation_is_created: bool
+    nrf_relation_is_created: bool
+
 
 class PCFOperatorCharm(CharmBase):
     """Main class to describe juju event handling for the 5G PCF operator."""
@@ -33,6 +60,10 @@ class PCFOperatorCharm(CharmBase):
         super().__init__(*args)
         self._container_name = self._service_name = "pcf"
         self._container = self.unit.get_container(self._container_name)
+        self._last_render_key: Optional[Tuple[str, str]] = None
+        # Juju runs one charm process per dispatch, so this flag is never reset: once the
+        # pebble layer is applied, it stays applied for the lifetime of the charm object.
+        self._reconciled_this_dispatch = False
         self._database = DatabaseRequires(
             self, relation_name="database", database_name=DATABASE_NAME
         )
@@ -42,120 +73,154 @@ class PCFOperatorCharm(CharmBase):
         self.framework.observe(self._database.on.database_created, self._on_database_created)
         self.framework.observe(self._nrf_requires.on.nrf_available, self._on_nrf_available)
 
-        self._service_patcher = KubernetesServicePatch(
-            charm=self,
-            ports=[
-                ServicePort(name="sbi", port=29507),
-            ],
-        )
+        self._service_patcher = KubernetesServicePatch(charm=self, ports=_SBI_PORTS)
 
     def _on_database_created(self, event: DatabaseCreatedEvent) -> None:
         """Handle database created event."""
-        if not self._container.can_connect():
+        preconditions = self._collect_preconditions()
+        if not preconditions.can_connect:
             self.unit.status = WaitingStatus("Waiting for container to be ready")
             event.defer()
             return
-        if not self._nrf_relation_is_created:
+        if not preconditions.nrf_relation_is_created:
             self.unit.status = BlockedStatus("Waiting for NRF relation to be created")
             event.defer()
             return
-        if not self._nrf_data_is_available:
+        nrf_url = self._nrf_requires.get_nrf_url()
+        if not nrf_url:
             self.unit.status = WaitingStatus("Waiting for NRF data to be available")
             event.defer()
             return
         self._write_config_file(
-            default_database_url=event.uris.split(",")[0],
-            nrf_url=self._nrf_requires.get_nrf_url(),
+            default_database_url=event.uris.partition(",")[0],
+            nrf_url=nrf_url,
         )
-        self._on_pcf_pebble_ready(event)
+        self._apply_pebble_layer()
 
     def _on_nrf_available(self, event: NRFAvailableEvent) -> None:
-        if not self._container.can_connect():
+        preconditions = self._collect_preconditions()
+        if not preconditions.can_connect:
             self.unit.status = WaitingStatus("Waiting for container to be ready")
             event.defer()
             return
-        if not self._database_relation_is_created:
+        if not preconditions.database_relation_is_created:
             self.unit.status = BlockedStatus("Waiting for database relation to be created")
             event.defer()
             return
-        if not self._database_is_available:
+        database_data = self._database_data
+        if not database_data:
             self.unit.status = WaitingStatus("Waiting for database to be available")
             event.defer()
             return
         self._write_config_file(
-            default_database_url=self._database_data["uris"].split(",")[0], nrf_url=event.url
+            default_database_url=database_data["uris"].partition(",")[0],
+            nrf_url=event.url,
+        )
+        self._apply_pebble_layer()
+
+    def _collect_preconditions(self) -> Preconditions:
+        """Collects the container and relation state in a single pass.
+
+        Relation data is not read here; handlers fetch it only when they consume it.
+
+        Returns:
+            Preconditions: Snapshot of the state the event handlers depend on.
+        """
+        return Preconditions(
+            can_connect=self._container.can_connect(),
+            database_relation_is_created=self._database_relation_is_created,
+            nrf_relation_is_created=self._nrf_relation_is_created,
         )
-        self._on_pcf_pebble_ready(event)
 
     def _write_config_file(self, default_database_url: str, nrf_url: str) -> None:
-        jinja2_environment = Environment(loader=FileSystemLoader("src/templates/"))
-        template = jinja2_environment.get_template("pcfcfg.conf.j2")
-        content = template.render(
+        render_key = (default_database_url, nrf_url)
+        if render_key == self._last_render_key:
+            logger.debug("Config file %s already rendered, skipping", CONFIG_FILE_NAME)
+            return
+        content = _PCF_TEMPLATE.render(
             nrf_url=nrf_url,
             pcf_hostname=self._pcf_hostname,
             database_name=DATABASE_NAME,
             database_url=default_database_url,
         )
-        self._container.push(path=f"{BASE_CONFIG_PATH}/{CONFIG_FILE_NAME}", source=content)
-        logger.info(f"Pushed {CONFIG_FILE_NAME} config file")
+        if self._config_file_content_matches(content):
+            logger.debug("Config file %s unchanged, skipping push", CONFIG_FILE_NAME)
+        else:
+            self._container.push(path=f"{BASE_CONFIG_PATH}/{CONFIG_FILE_NAME}", source=content)
+            logger.info(f"Pushed {CONFIG_FILE_NAME} config file")
+        self._last_render_key = render_key
 
-    @property
-    def _nrf_data_is_available(self) -> bool:
-        """Returns whether the NRF data is available.
+    def _config_file_content_matches(self, content: str) -> bool:
+        """Returns whether the config file in the workload container matches the given content.
+
+        Args:
+            content (str): Expected content of the config file.
 
         Returns:
-            bool: Whether the NRF data is available.
+            bool: Whether the existing config file content is identical.
         """
-        if not self._nrf_requires.get_nrf_url():
+        try:
+            with self._container.pull(
+                f"{BASE_CONFIG_PATH}/{CONFIG_FILE_NAME}"
+            ) as existing_content:
+                return existing_content.read() == content
+        except PathError:
             return False
-        return True
 
     @property
-    def _database_is_available(self) -> bool:
-        """Returns whether the database is available.
-
-        Returns:
-            bool: Whether the database is available.
-        """
-        return self._database.is_resource_created()
+    def _database_data(self) -> Optional[Dict]:
+        """Returns the database data, if the database is available.
 
-    @property
-    def _database_data(self) -> Dict:
-        """Returns the database data.
+        The relation data is fetched once and the database is considered available when the
+        provider has shared a username and password.
 
         Returns:
-            Dict: The database data.
+            Dict: The database data, or None if the database is not available.
         """
-        if not self._database_is_available:
-            raise RuntimeError("Database is not available")
-        return self._database.fetch_relation_data()[self._database.relations[0].id]
+        database_data = self._database.fetch_relation_data().get(
+            self._database.relations[0].id, {}
+        )
+        if "username" not in database_data or "password" not in database_data:
+            return None
+        return database_data
 
     @property
     def _config_file_is_written(self) -> bool:
         if not self._container.exists(f"{BASE_CONFIG_PATH}/{CONFIG_FILE_NAME}"):
-            logger.info(f"Config file is not written: {CONFIG_FILE_NAME}")
+            logger.debug("Config file is not written: %s", CONFIG_FILE_NAME)
             return False
-        logger.info("Config file is written")
+        logger.debug("Config file is written")
         return True
 
-    def _on_pcf_pebble_ready(
-        self, event: Union[PebbleReadyEvent, DatabaseCreatedEvent, NRFAvailableEvent]
-    ) -> None:
-        if not self._database_relation_is_created:
+    def _on_pcf_pebble_ready(self, event: Union[PebbleReadyEvent, RelationJoinedEvent]) -> None:
+        if self._reconciled_this_dispatch:
+            logger.debug("Pebble layer already applied in this dispatch, skipping")
+            return
+        preconditions = self._collect_preconditions()
+        if not preconditions.database_relation_is_created:
             self.unit.status = BlockedStatus("Waiting for database relation to be created")
             return
-        if not self._nrf_relation_is_created:
+        if not preconditions.nrf_relation_is_created:
             self.unit.status = BlockedStatus("Waiting for NRF relation to be created")
             return
-        if not self._container.can_connect():
+        if not preconditions.can_connect:
             self.unit.status = WaitingStatus("Waiting for container to be ready")
             event.defer()
             return
         if not self._config_file_is_written:
             self.unit.status = WaitingStatus("Waiting for config file to be written")
             return
+        self._apply_pebble_layer()
+
+    def _apply_pebble_layer(self) -> None:
+        """Adds the PCF pebble layer, replans the services and sets the unit to active.
+
+        Later pebble_ready and database_relation_joined events handled by the same charm
+        process are skipped once this has run.
+        """
         self._container.add_layer("pcf", self._pebble_layer, combine=True)
         self._container.replan()
+        self._reconciled_this_dispatch = True
         self.unit.status = ActiveStatus()
 
     @property
@@ -179,10 +244,12 @@ class PCFOperatorCharm(CharmBase):
             return False
         return True
 
-    @property
+    @cached_property
     def _pebble_layer(self) -> Layer:
         """Returns pebble layer for the charm.
 
+        The layer only depends on the cached pod IP and constants, so it is built once.
+
         Returns:
             Layer: Pebble Layer
         """
@@ -201,23 +268,16 @@ class PCFOperatorCharm(CharmBase):
             }
         )
 
-    @property
+    @cached_property
     def _environment_variables(self) -> dict:
-        return {
-            "GRPC_GO_LOG_VERBOSITY_LEVEL": "99",
-            "GRPC_GO_LOG_SEVERITY_LEVEL": "info",
-            "GRPC_TRACE": "all",
-            "GRPC_VERBOSITY": "debug",
-            "POD_IP": str(self._pod_ip),
-            "MANAGED_BY_CONFIG_POD": "true",
-        }
+        return {**_STATIC_ENVIRONMENT_VARIABLES, "POD_IP": str(self._pod_ip)}
 
-    @property
+    @cached_property
     def _pod_ip(self) -> Optional[IPv4Address]:
         """Get the IP address of the Kubernetes pod."""
         return IPv4Address(check_output(["unit-get", "private-address"]).decode().strip())
 
-    @property
+    @cached_property
     def _pcf_hostname(self) -> str:
         return f"{self.model.app.name}.{self.model.name}.svc.cluster.local"
 
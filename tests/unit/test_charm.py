@@ -6,6 +6,7 @@ from unittest.mock import Mock, patch
 
 from ops import testing
 from ops.model import ActiveStatus
+from ops.pebble import PathError
 
 from charm import PCFOperatorCharm
 
@@ -52,11 +53,14 @@ class TestCharm(unittest.TestCase):
         )
         return database_url
 
+    @patch("charm.check_output")
     @patch("ops.model.Container.push")
     def test_given_nrf_is_available_when_database_is_created_then_config_file_is_written(
         self,
         patch_push,
+        patch_check_output,
     ):
+        patch_check_output.return_value = b"1.2.3.4"
         database_url_0 = "1.2.3.4:1234"
         database_url_1 = "5.6.7.8:1111"
         pcf_hostname = f"pcf-operator.{self.namespace}.svc.cluster.local"
@@ -73,11 +77,14 @@ class TestCharm(unittest.TestCase):
             source=f'configuration:\n  defaultBdtRefId: BdtPolicyId-\n  mongodb:\n    name: free5gc\n    url: { database_url_0 }\n  nrfUri: { nrf_url }\n  pcfName: PCF\n  plmnList:\n  - plmnId:\n      mcc: "208"\n      mnc: "93"\n  - plmnId:\n      mcc: "333"\n      mnc: "88"\n  sbi:\n    bindingIPv4: 0.0.0.0\n    port: 29507\n    registerIPv4: { pcf_hostname }\n    scheme: http\n  serviceList:\n  - serviceName: npcf-am-policy-control\n  - serviceName: npcf-smpolicycontrol\n    suppFeat: 3fff\n  - serviceName: npcf-bdtpolicycontrol\n  - serviceName: npcf-policyauthorization\n    suppFeat: 3\n  - serviceName: npcf-eventexposure\n  - serviceName: npcf-ue-policy-control\ninfo:\n  description: PCF initial local configuration\n  version: 1.0.0\nlogger:\n  AMF:\n    ReportCaller: false\n    debugLevel: info\n  AUSF:\n    ReportCaller: false\n    debugLevel: info\n  Aper:\n    ReportCaller: false\n    debugLevel: info\n  CommonConsumerTest:\n    ReportCaller: false\n    debugLevel: info\n  FSM:\n    ReportCaller: false\n    debugLevel: info\n  MongoDBLibrary:\n    ReportCaller: false\n    debugLevel: info\n  N3IWF:\n    ReportCaller: false\n    debugLevel: info\n  NAS:\n    ReportCaller: false\n    debugLevel: info\n  NGAP:\n    ReportCaller: false\n    debugLevel: info\n  NRF:\n    ReportCaller: false\n    debugLevel: info\n  NamfComm:\n    ReportCaller: false\n    debugLevel: info\n  NamfEventExposure:\n    ReportCaller: false\n    debugLevel: info\n  NsmfPDUSession:\n    ReportCaller: false\n    debugLevel: info\n  NudrDataRepository:\n    ReportCaller: false\n    debugLevel: info\n  OpenApi:\n    ReportCaller: false\n    debugLevel: info\n  PCF:\n    ReportCaller: false\n    debugLevel: info\n  PFCP:\n    ReportCaller: false\n    debugLevel: info\n  PathUtil:\n    ReportCaller: false\n    debugLevel: info\n  SMF:\n    ReportCaller: false\n    debugLevel: info\n  UDM:\n    ReportCaller: false\n    debugLevel: info\n  UDR:\n    ReportCaller: false\n    debugLevel: info\n  WEBUI:\n    ReportCaller: false\n    debugLevel: info',  # noqa: E501
         )
 
+    @patch("charm.check_output")
     @patch("ops.model.Container.push")
     def test_given_database_is_available_when_nrf_is_available_then_config_file_is_written(
         self,
         patch_push,
+        patch_check_output,
     ):
+        patch_check_output.return_value = b"1.2.3.4"
         nrf_url = "2.2.2.2"
         pcf_hostname = f"pcf-operator.{self.namespace}.svc.cluster.local"
 
@@ -91,6 +98,78 @@ class TestCharm(unittest.TestCase):
             source=f'configuration:\n  defaultBdtRefId: BdtPolicyId-\n  mongodb:\n    name: free5gc\n    url: { database_url_0 }\n  nrfUri: { nrf_url }\n  pcfName: PCF\n  plmnList:\n  - plmnId:\n      mcc: "208"\n      mnc: "93"\n  - plmnId:\n      mcc: "333"\n      mnc: "88"\n  sbi:\n    bindingIPv4: 0.0.0.0\n    port: 29507\n    registerIPv4: { pcf_hostname }\n    scheme: http\n  serviceList:\n  - serviceName: npcf-am-policy-control\n  - serviceName: npcf-smpolicycontrol\n    suppFeat: 3fff\n  - serviceName: npcf-bdtpolicycontrol\n  - serviceName: npcf-policyauthorization\n    suppFeat: 3\n  - serviceName: npcf-eventexposure\n  - serviceName: npcf-ue-policy-control\ninfo:\n  description: PCF initial local configuration\n  version: 1.0.0\nlogger:\n  AMF:\n    ReportCaller: false\n    debugLevel: info\n  AUSF:\n    ReportCaller: false\n    debugLevel: info\n  Aper:\n    ReportCaller: false\n    debugLevel: info\n  CommonConsumerTest:\n    ReportCaller: false\n    debugLevel: info\n  FSM:\n    ReportCaller: false\n    debugLevel: info\n  MongoDBLibrary:\n    ReportCaller: false\n    debugLevel: info\n  N3IWF:\n    ReportCaller: false\n    debugLevel: info\n  NAS:\n    ReportCaller: false\n    debugLevel: info\n  NGAP:\n    ReportCaller: false\n    debugLevel: info\n  NRF:\n    ReportCaller: false\n    debugLevel: info\n  NamfComm:\n    ReportCaller: false\n    debugLevel: info\n  NamfEventExposure:\n    ReportCaller: false\n    debugLevel: info\n  NsmfPDUSession:\n    ReportCaller: false\n    debugLevel: info\n  NudrDataRepository:\n    ReportCaller: false\n    debugLevel: info\n  OpenApi:\n    ReportCaller: false\n    debugLevel: info\n  PCF:\n    ReportCaller: false\n    debugLevel: info\n  PFCP:\n    ReportCaller: false\n    debugLevel: info\n  PathUtil:\n    ReportCaller: false\n    debugLevel: info\n  SMF:\n    ReportCaller: false\n    debugLevel: info\n  UDM:\n    ReportCaller: false\n    debugLevel: info\n  UDR:\n    ReportCaller: false\n    debugLevel: info\n  WEBUI:\n    ReportCaller: false\n    debugLevel: info',
         )
 
+    @patch("charm.check_output")
+    def test_given_config_file_is_unchanged_when_nrf_is_available_then_config_file_is_not_pushed(
+        self, patch_check_output
+    ):
+        patch_check_output.return_value = b"1.2.3.4"
+        self.harness.set_can_connect(container="pcf", val=True)
+        self.harness.charm.unit.get_container("pcf").make_dir("/etc/pcf", make_parents=True)
+        self._database_is_available()
+        self.harness.charm._on_nrf_available(event=Mock(url="2.2.2.2"))
+        self.harness.charm._last_render_key = None
+        container = self.harness.charm._container
+
+        with patch.object(container, "pull", wraps=container.pull) as patch_pull, patch.object(
+            container, "push"
+        ) as patch_push:
+            self.harness.charm._on_nrf_available(event=Mock(url="2.2.2.2"))
+
+        patch_pull.assert_called_once_with("/etc/pcf/pcfcfg.conf")
+        patch_push.assert_not_called()
+
+    @patch("charm.check_output")
+    def test_given_config_file_content_differs_when_nrf_is_available_then_config_file_is_pushed(
+        self, patch_check_output
+    ):
+        patch_check_output.return_value = b"1.2.3.4"
+        self.harness.set_can_connect(container="pcf", val=True)
+        container = self.harness.charm.unit.get_container("pcf")
+        container.push("/etc/pcf/pcfcfg.conf", source="outdated content", make_dirs=True)
+        self._database_is_available()
+
+        with patch.object(
+            self.harness.charm._container, "push", wraps=self.harness.charm._container.push
+        ) as patch_push:
+            self.harness.charm._on_nrf_available(event=Mock(url="2.2.2.2"))
+
+        patch_push.assert_called_once()
+        self.assertNotEqual(container.pull("/etc/pcf/pcfcfg.conf").read(), "outdated content")
+
+    @patch("charm.check_output")
+    @patch("ops.model.Container.pull")
+    @patch("ops.model.Container.push")
+    def test_given_config_file_was_rendered_when_same_nrf_is_available_then_config_is_not_pulled(
+        self, patch_push, patch_pull, patch_check_output
+    ):
+        patch_check_output.return_value = b"1.2.3.4"
+        patch_pull.side_effect = PathError(kind="not-found", message="not found")
+        self.harness.set_can_connect(container="pcf", val=True)
+        self._database_is_available()
+        self.harness.charm._on_nrf_available(event=Mock(url="2.2.2.2"))
+        patch_pull.reset_mock()
+        patch_push.reset_mock()
+
+        self.harness.charm._on_nrf_available(event=Mock(url="2.2.2.2"))
+
+        patch_pull.assert_not_called()
+        patch_push.assert_not_called()
+
+    @patch("charm.check_output")
+    @patch("ops.model.Container.exists")
+    @patch("ops.model.Container.push")
+    def test_given_nrf_is_available_when_database_is_created_then_status_is_active(
+        self, _, patch_exists, patch_check_output
+    ):
+        patch_check_output.return_value = b"1.2.3.4"
+        self.harness.set_can_connect(container="pcf", val=True)
+        self._nrf_is_available()
+
+        self.harness.charm._on_database_created(event=Mock(uris="1.2.3.4:1234"))
+
+        patch_exists.assert_not_called()
+        self.assertEqual(self.harness.model.unit.status, ActiveStatus())
+
     @patch("charm.check_output")
     @patch("ops.model.Container.exists")
     def test_given_config_file_is_written_when_pebble_ready_then_pebble_plan_is_applied(
@@ -129,6 +208,79 @@ class TestCharm(unittest.TestCase):
 
         self.assertEqual(expected_plan, updated_plan)
 
+    @patch("charm.check_output")
+    @patch("ops.model.Container.push")
+    def test_given_database_is_available_when_nrf_is_available_then_database_data_is_fetched_once(
+        self, _, patch_check_output
+    ):
+        patch_check_output.return_value = b"1.2.3.4"
+        self.harness.set_can_connect(container="pcf", val=True)
+        self._database_is_available()
+
+        with patch(
+            "charm.DatabaseRequires.fetch_relation_data",
+            wraps=self.harness.charm._database.fetch_relation_data,
+        ) as patch_fetch_relation_data:
+            self.harness.charm._on_nrf_available(event=Mock(url="2.2.2.2"))
+
+        patch_fetch_relation_data.assert_called_once()
+
+    @patch("charm.DatabaseRequires.fetch_relation_data")
+    @patch("charm.check_output")
+    @patch("ops.model.Container.exists")
+    def test_given_relations_are_created_when_pebble_ready_then_relation_data_is_not_fetched(
+        self, patch_exists, patch_check_output, patch_fetch_relation_data
+    ):
+        patch_exists.return_value = True
+        patch_check_output.return_value = b"1.2.3.4"
+        self._database_is_available()
+        self._nrf_is_available()
+
+        self.harness.container_pebble_ready("pcf")
+
+        patch_fetch_relation_data.assert_not_called()
+
+    @patch("ops.model.Container.replan")
+    @patch("charm.check_output")
+    @patch("ops.model.Container.push")
+    def test_given_layer_applied_on_nrf_available_when_database_relation_joined_then_no_replan(
+        self, _, patch_check_output, patch_replan
+    ):
+        patch_check_output.return_value = b"1.2.3.4"
+        self.harness.set_can_connect(container="pcf", val=True)
+        database_relation_id = self.harness.add_relation("database", "mongodb")
+        self.harness.update_relation_data(
+            relation_id=database_relation_id,
+            app_or_unit="mongodb",
+            key_values={"username": "banana", "password": "pizza", "uris": "1.2.3.4:1234"},
+        )
+        self._nrf_is_available()
+        self.harness.charm._on_nrf_available(event=Mock(url="2.2.2.2"))
+        patch_replan.reset_mock()
+
+        self.harness.add_relation_unit(
+            relation_id=database_relation_id, remote_unit_name="mongodb/0"
+        )
+
+        patch_replan.assert_not_called()
+
+    @patch("ops.model.Container.replan")
+    @patch("charm.check_output")
+    @patch("ops.model.Container.exists")
+    def test_given_pebble_layer_was_applied_when_pebble_ready_again_then_services_are_not_replanned(
+        self, patch_exists, patch_check_output, patch_replan
+    ):
+        patch_exists.return_value = True
+        patch_check_output.return_value = b"1.2.3.4"
+        self._database_is_available()
+        self._nrf_is_available()
+        self.harness.container_pebble_ready("pcf")
+        patch_replan.reset_mock()
+
+        self.harness.container_pebble_ready("pcf")
+
+        patch_replan.assert_not_called()
+
     @patch("charm.check_output")
     @patch("ops.model.Container.exists")
     def test_given_config_file_is_written_when_pebble_ready_then_status_is_active(